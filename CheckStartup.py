@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+from CouplingCLI import STARTUP_BUDGET_S
+# Startup check of the headless coupling CLI, meant to run in CI or before deploying the cron job:
+#   python CheckStartup.py
+# Exits with status 1 if a cold start (interpreter start included) is over STARTUP_BUDGET_S or if importing
+# Coupling loads one of the plotting/clustering backends.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must only be imported by the functions that plot or run the optional clustering methods
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'sklearn']
+
+# Commands timed in a fresh interpreter: the CLI itself, and the imports it does before the calculation begins
+STARTUP_COMMANDS = {
+    'CouplingCLI.py --help': [sys.executable, 'CouplingCLI.py', '--help'],
+    'import Commit, Coupling': [sys.executable, '-c', 'import Commit, Coupling']
+}
+
+
+# Wall time of a command in a new process, the best of a few runs so that a busy machine does not fail the check
+def get_wall_time(command: list[str], runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# Heavy modules that are loaded after importing Coupling in a new process
+def get_loaded_heavy_modules() -> list[str]:
+    code = f"import sys, Coupling; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, check=True, capture_output=True, text=True)
+    return [m for m in result.stdout.strip().split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the cold start time of CouplingCLI against its budget")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs of each command, the fastest counts")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_S, help="Max wall time in seconds")
+    args = parser.parse_args()
+
+    failed = False
+    for name, command in STARTUP_COMMANDS.items():
+        wall_time = get_wall_time(command, args.runs)
+        over = wall_time > args.budget
+        failed = failed or over
+        print(f"{name}: {wall_time:.3f} seconds (budget {args.budget}s){' OVER BUDGET' if over else ''}")
+
+    loaded = get_loaded_heavy_modules()
+    if loaded:
+        failed = True
+        print(f"import Coupling loads: {', '.join(loaded)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
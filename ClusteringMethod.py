@@ -1,19 +1,9 @@
-import pandas as pd
-
 from Commit import Commit
 
-from datetime import datetime
-from scipy.signal import argrelextrema
 import numpy as np
 
-# Libraries needed for Kernel Density
-from sklearn.neighbors import KernelDensity
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Slider
-from matplotlib.dates import DateFormatter
-
-# Libraries needed for DBSCAN
-from sklearn.cluster import DBSCAN
+# scipy, scikit-learn and matplotlib are slow to import and matplotlib needs a display backend,
+# so they are imported in the methods that use them
 
 
 class DBSCANClustering:
@@ -34,6 +24,7 @@ class DBSCANClustering:
 
     # Returns a list of clusters, where each cluster is a list of commits
     def run(self, commits: list[Commit]) -> list[list[Commit]]:
+        from sklearn.cluster import DBSCAN
         commits_np = np.array(commits).reshape(-1, 1)
         unix_times = np.array([c.unix_time for c in commits]).reshape(-1, 1)
         dbscan = DBSCAN(eps=self.eps, min_samples=2).fit(X=unix_times)
@@ -42,6 +33,7 @@ class DBSCANClustering:
 
     # Returns the cluster ID for each commit
     def run_inverted(self, commits: list[Commit]) -> list[int]:
+        from sklearn.cluster import DBSCAN
         unix_times = np.array([c.unix_time for c in commits]).reshape(-1, 1)
         dbscan = DBSCAN(eps=self.eps, min_samples=2).fit(X=unix_times)
         return list(cluster_id for cluster_id in dbscan.labels_ if cluster_id != -1)
@@ -60,6 +52,8 @@ class KDEClustering:
         self.clusters = []
 
     def run(self, commits: list[Commit]):
+        from scipy.signal import argrelextrema
+        from sklearn.neighbors import KernelDensity
         self.unix_times = np.array([c.unix_time for c in commits]).reshape(-1, 1)
         commits_np = np.array(commits).reshape(-1, 1)
         x_vector = np.linspace(self.unix_times[0], self.unix_times[-1], self.gran)
@@ -78,7 +72,12 @@ class KDEClustering:
             self.clusters.append(commits_np[cluster_x])
         return self.clusters
 
+    # Splits the density curve at its minima, without minima (e.g. a single burst) the whole span is one range
     def __calc_cluster_ranges(self, s, e, mi):
+        if len(mi) == 0:
+            self.ranges_x = [s]
+            self.ranges_y = [e]
+            return
         self.ranges_x = [s[:mi[0] + 1]]
         self.ranges_y = [e[:mi[0] + 1]]
         for i in range(0, len(mi) - 1):
@@ -87,48 +86,70 @@ class KDEClustering:
         self.ranges_x.append(s[mi[-1]:])
         self.ranges_y.append(e[mi[-1]:])
 
-    def plot_density(self, window: int = 120):
+    # Pre-aggregated plot data: the density curve of each cluster range, down-sampled to at most max_points points
+    # in total, and the number of commits per bin_size seconds (only non-empty bins). Times are UTC datetime64.
+    def get_density_data(self, bin_size: int = 2, max_points: int = 2000) -> dict:
+        step = max(1, int(np.ceil(sum(len(r) for r in self.ranges_x) / max_points)))
+        ranges = [(self.ranges_x[i].ravel()[::step].astype('datetime64[s]'), self.ranges_y[i][::step])
+                  for i in range(0, len(self.ranges_x))]
+
+        times = self.unix_times.ravel()
+        bins, counts = np.unique((times - times[0]) // bin_size, return_counts=True)
+        commit_bins = (times[0] + bins * bin_size).astype('datetime64[s]')
+        return {'ranges': ranges, 'commit_bins': commit_bins, 'commit_counts': counts}
+
+    # Shows the density graph with a time slider, or saves the whole time span to output without a display.
+    # window is the number of seconds shown at once in the interactive graph.
+    def plot_density(self, window: int = 120, output: str = None, bin_size: int = None):
         if self.ranges_x is None:
             print("Error! Please call run first")
             return
 
-        fig, axs = plt.subplots(2)
-        fig.suptitle('Density Graph')
-        fig.subplots_adjust(left=0.25, bottom=0.25)
+        from matplotlib.dates import DateFormatter
 
         time_left = self.unix_times[0][0]
         time_right = self.unix_times[-1][0]
-        axis_position = plt.axes([0.2, 0.1, 0.65, 0.03],
-                                 facecolor='White')
-        slider_position = Slider(
-            ax=axis_position, label='Time', valmin=time_left, valmax=time_right, valinit=time_left)
+        if bin_size is None:
+            bin_size = max(1, window // 60) if output is None else max(1, int(time_right - time_left) // 1000)
+        data = self.get_density_data(bin_size=bin_size)
+
+        if output is None:
+            import matplotlib.pyplot as plt
+            fig, axs = plt.subplots(2)
+        else:
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=(12, 6))
+            axs = fig.subplots(2)
+        fig.suptitle('Density Graph')
 
         colors = ['r', 'g', 'b']
-        for i in range(0, len(self.ranges_y)):
-            _x = [datetime.utcfromtimestamp(tm[0]) for tm in self.ranges_x[i]]
-            _y = self.ranges_y[i]
-            axs[0].plot_date(_x, _y, colors[i % 3])
-
-        initial_window = [datetime.utcfromtimestamp(
-            time_left), datetime.utcfromtimestamp(time_left + window)]
+        for i, (_x, _y) in enumerate(data['ranges']):
+            axs[0].plot(_x, _y, colors[i % 3])
+        axs[1].plot(data['commit_bins'], data['commit_counts'], 'o', markersize=5, markerfacecolor="red")
 
         axs[0].xaxis.set_major_formatter(DateFormatter('%d/%m %H:%M'))
         axs[1].xaxis.set_major_formatter(DateFormatter('%d/%m %H:%M'))
 
-        axs[0].set_xlim(initial_window)
-        axs[1].set_xlim(initial_window)
+        if output is not None:
+            fig.savefig(output)
+            return
 
-        axs[1].plot_date([datetime.utcfromtimestamp(tm[0]) for tm in self.unix_times], [
-                         0]*len(self.unix_times), marker="o", markersize=5, markerfacecolor="red")
+        from matplotlib.widgets import Slider
+
+        fig.subplots_adjust(left=0.25, bottom=0.25)
+        axis_position = plt.axes([0.2, 0.1, 0.65, 0.03],
+                                 facecolor='White')
+        slider_position = Slider(
+            ax=axis_position, label='Time', valmin=time_left, valmax=time_right, valinit=time_left)
 
         def update(val):
             pos = slider_position.val
-            axs[0].set_xlim([datetime.utcfromtimestamp(
-                pos), datetime.utcfromtimestamp(pos + window)])
-            axs[1].set_xlim([datetime.utcfromtimestamp(
-                pos), datetime.utcfromtimestamp(pos + window)])
+            window_x = np.array([pos, pos + window]).astype('datetime64[s]')
+            axs[0].set_xlim(window_x)
+            axs[1].set_xlim(window_x)
             fig.canvas.draw_idle()
 
+        update(time_left)
         # update function called using on_changed() function
         slider_position.on_changed(update)
 
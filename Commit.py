@@ -53,13 +53,12 @@ def load_commits(file_path: str) -> list[Commit]:
         commits_list = json.load(f)
 
     # convert each dict in list to Commit object
-    all_commits = []
-    for commit_dict in commits_list:
-        # create MS object from nested dict in commit_dict
-        ms_dict = commit_dict.pop('ms')
-        ms = MS(**ms_dict)
-        # create Commit object and append to list
-        commit = Commit(ms=ms, **commit_dict)
-        all_commits.append(commit)
+    return [commit_from_dict(commit_dict) for commit_dict in commits_list]
 
-    return all_commits
\ No newline at end of file
+
+# Creates a Commit object from a dict in the format written by CommitEncoder
+def commit_from_dict(commit_dict: dict) -> Commit:
+    # create MS object from nested dict in commit_dict
+    commit_dict = dict(commit_dict)
+    ms = MS(**commit_dict.pop('ms'))
+    return Commit(ms=ms, **commit_dict)
\ No newline at end of file
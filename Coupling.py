@@ -6,17 +6,118 @@ from ClusteringMethod import DBSCANClustering
 from datetime import *
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.cluster import DBSCAN
+from scipy import sparse
 from time import perf_counter
 
 
+# Marks first_cotime / last_cotime of pairs that never occur in the same cluster
+NO_COTIME = -1
+
+
+# Expands every cluster (column of a CSC membership matrix) into the pairs of members (i < j) it contains.
+# Returns the positions of both members in membership.indices / membership.data and the cluster of each pair.
+# Clusters of equal size are handled together, so the Python loop runs once per distinct cluster size.
+def _cluster_pairs(membership: sparse.csc_matrix) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    indptr = membership.indptr
+    sizes = np.diff(indptr)
+    pairs_i, pairs_j, pairs_c = [], [], []
+    for k in np.unique(sizes[sizes > 1]):
+        cols = np.flatnonzero(sizes == k)
+        positions = indptr[cols][:, None] + np.arange(k)
+        a, b = np.triu_indices(k, 1)
+        pairs_i.append(positions[:, a].ravel())
+        pairs_j.append(positions[:, b].ravel())
+        pairs_c.append(np.repeat(cols, len(a)))
+    if not pairs_i:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    return (np.concatenate(pairs_i).astype(np.int64), np.concatenate(pairs_j).astype(np.int64),
+            np.concatenate(pairs_c).astype(np.int64))
+
+
+# Position of pair (i, j), i < j, in the row-major upper triangle of an n x n matrix
+def _triu_pos(i, j, n: int):
+    return i * n - i * (i + 1) // 2 + (j - i - 1)
+
+
+# Applies the same linear transformation (summing rows, slicing) to the membership and churn matrices.
+# The churn is shifted by one so that cells without churn are not dropped, both results keep the same structure.
+def _transform_membership(membership: sparse.csc_matrix, churn: sparse.csc_matrix, transform):
+    counts = transform(membership.astype(np.int64)).tocsc()
+    shifted = transform(sparse.csc_matrix((churn.data + 1, churn.indices, churn.indptr), shape=churn.shape)).tocsc()
+    counts.sort_indices()
+    shifted.sort_indices()
+    churn = sparse.csc_matrix((shifted.data - counts.data, counts.indices, counts.indptr), shape=counts.shape)
+    return counts.astype(bool), churn
+
+
+def _ratio(num, den):
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den != 0)
+
+
+# Scoring methods, each one computes the score of all pairs at once from the arrays in pairs:
+#   len_x, len_y, len_intersect, len_union  number of clusters with MS x, MS y, both, any of them
+#   n_clusters                              number of clusters in the index
+#   churn_x, churn_y                        lines added + deleted by MS x / MS y over all clusters
+#   churn_sq_x, churn_sq_y                  sum over clusters of the squared churn per cluster
+#   churn_min, churn_dot                    sum over shared clusters of min(churn x, churn y) / churn x * churn y
+SCORING_METHODS = {}
+
+
+def scoring_method(name: str):
+    def register(fn):
+        SCORING_METHODS[name] = fn
+        return fn
+
+    return register
+
+
+@scoring_method('jaccard')
+def get_jaccard_index(pairs):
+    return pairs['len_intersect'] / pairs['len_union']
+
+
+@scoring_method('sorensen')
+def get_sorensen_coef(pairs):
+    return pairs['len_intersect'] * 2 / (pairs['len_x'] + pairs['len_y'])
+
+
+@scoring_method('cosine')
+def get_cosine_similarity(pairs):
+    return pairs['len_intersect'] / np.sqrt(pairs['len_x'] * pairs['len_y'])
+
+
+# How much more often a pair co-occurs than if the MS changed independently of each other
+@scoring_method('lift')
+def get_lift(pairs):
+    return pairs['len_intersect'] * pairs['n_clusters'] / (pairs['len_x'] * pairs['len_y'])
+
+
+# Jaccard index where each cluster counts with the churn of the MS in it, sum of min / sum of max
+@scoring_method('weighted_jaccard')
+def get_weighted_jaccard_index(pairs):
+    return _ratio(pairs['churn_min'], pairs['churn_x'] + pairs['churn_y'] - pairs['churn_min'])
+
+
+@scoring_method('weighted_cosine')
+def get_weighted_cosine_similarity(pairs):
+    return _ratio(pairs['churn_dot'], np.sqrt(pairs['churn_sq_x'] * pairs['churn_sq_y']))
+
+
 class ClusterIndex:
     def __init__(self, clusters: list[list[Commit]], clusters_per_day=None):
         self.clusters = clusters
         self.index: dict[MS, set[int]] = {}
         self.clusters_per_day = clusters_per_day
+        self.mss: list[MS] = []
+        self.ms_codes: dict[MS, int] = {}
+        self.membership: sparse.csc_matrix = None
+        self.churn: sparse.csc_matrix = None
+        self.cluster_times: np.ndarray = None
+        self.__pair_stats = None
+        self.__pair_counts: dict[tuple[int, int], list] = None
+        self.__churn_totals: list[list] = None
 
     # Creates an inverted index of Microservice to the clusters they occur in
     def create_index(self):
@@ -26,6 +127,92 @@ class ClusterIndex:
                     self.index[commit.ms] = {idx}
                 else:
                     self.index[commit.ms].add(idx)
+        self.__create_membership()
+
+    # Folds one more cluster into the index, updating the running pair counters instead of recounting all clusters.
+    # Clusters are expected to be added in time order, as done by the streaming mode.
+    def add_cluster(self, cluster: list[Commit]):
+        if self.__pair_counts is None:
+            self.__pair_counts, self.__churn_totals = self.__get_pair_counts()
+
+        idx = len(self.clusters)
+        self.clusters.append(cluster)
+        cluster_churn: dict[int, int] = {}
+        for commit in cluster:
+            if commit.ms not in self.index:
+                self.index[commit.ms] = {idx}
+                self.ms_codes[commit.ms] = len(self.mss)
+                self.mss.append(commit.ms)
+                self.__churn_totals.append([0, 0])
+            else:
+                self.index[commit.ms].add(idx)
+            code = self.ms_codes[commit.ms]
+            cluster_churn[code] = cluster_churn.get(code, 0) + commit.lines_added + commit.lines_deleted
+
+        for code, churn in cluster_churn.items():
+            self.__churn_totals[code][0] += churn
+            self.__churn_totals[code][1] += churn * churn
+
+        cluster_time = min(c.unix_time for c in cluster)
+        for pair in combinations(sorted(cluster_churn), 2):
+            churn_x, churn_y = cluster_churn[pair[0]], cluster_churn[pair[1]]
+            counts = self.__pair_counts.get(pair)
+            if counts is None:
+                self.__pair_counts[pair] = [1, cluster_time, cluster_time, min(churn_x, churn_y), churn_x * churn_y]
+            else:
+                counts[0] += 1
+                counts[1] = min(counts[1], cluster_time)
+                counts[2] = max(counts[2], cluster_time)
+                counts[3] += min(churn_x, churn_y)
+                counts[4] += churn_x * churn_y
+
+        # Rebuilt on demand, only aggregate() and between() need them
+        self.membership = None
+        self.churn = None
+        self.cluster_times = None
+        self.__pair_stats = None
+
+    # Running pair counters of the clusters indexed so far, keyed by (code_x, code_y) with code_x < code_y,
+    # and the running churn totals of each MS
+    def __get_pair_counts(self):
+        if not self.index:
+            return {}, []
+        stats = self.__get_pair_stats()
+        columns = zip(stats['codes_x'].tolist(), stats['codes_y'].tolist(), stats['intersect'].tolist(),
+                      stats['first'].tolist(), stats['last'].tolist(), stats['churn_min'].tolist(),
+                      stats['churn_dot'].tolist())
+        pair_counts = {(x, y): [count, first, last, churn_min, churn_dot]
+                       for x, y, count, first, last, churn_min, churn_dot in columns}
+        churn_totals = [[float(total), float(sq_total)]
+                        for total, sq_total in zip(stats['churn_totals'], stats['churn_sq_totals'])]
+        return pair_counts, churn_totals
+
+    def __get_membership(self) -> sparse.csc_matrix:
+        if self.membership is None:
+            self.__create_membership()
+        return self.membership
+
+    # Boolean MS x cluster matrix, the churn of each MS in each cluster (same structure) and the start time of
+    # each cluster, the base for all pair statistics
+    def __create_membership(self):
+        self.mss = list(self.index.keys())
+        self.ms_codes = {ms: code for code, ms in enumerate(self.mss)}
+        rows = np.fromiter((self.ms_codes[c.ms] for cluster in self.clusters for c in cluster), dtype=np.int64)
+        cols = np.repeat(np.arange(len(self.clusters)), [len(cluster) for cluster in self.clusters])
+        churn = np.fromiter((c.lines_added + c.lines_deleted for cluster in self.clusters for c in cluster),
+                            dtype=np.float64, count=len(rows))
+        shape = (len(self.mss), len(self.clusters))
+
+        counts = sparse.csc_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=shape)
+        shifted = sparse.csc_matrix((churn + 1, (rows, cols)), shape=shape)
+        counts.sort_indices()
+        shifted.sort_indices()
+        self.membership = counts.astype(bool)
+        # Several commits of a MS in one cluster are summed, the shift of one per commit is subtracted again
+        self.churn = sparse.csc_matrix((shifted.data - counts.data, counts.indices, counts.indptr), shape=shape)
+        self.cluster_times = np.array([min(c.unix_time for c in cluster) if len(cluster) else NO_COTIME
+                                       for cluster in self.clusters], dtype=np.int64)
+        self.__pair_stats = None
 
     def get_internal_index(self):
         return self.index
@@ -36,57 +223,231 @@ class ClusterIndex:
     def get_clusters_per_day(self):
         return self.clusters_per_day
 
-    def __get_sorensen_coef(self, msx_set, msy_set) -> float:
-        return len(msx_set & msy_set) * 2 / (len(msx_set) + len(msy_set))
-
-    def __get_jaccard_index(self, msx_set, msy_set) -> float:
-        return len(msx_set & msy_set) / len(msx_set | msy_set)
-
-    def __get_active_period(self, msx, msy):
-        intersection = self.index[msx] & self.index[msy]
-        if not intersection:
-            return "TBD to TBD"
-        start_date = self.clusters[min(intersection)][0].unix_time
-        end_date = self.clusters[max(intersection)][0].unix_time
-        return f"{datetime.fromtimestamp(start_date).strftime('%Y-%m-%d')} to {datetime.fromtimestamp(end_date).strftime('%Y-%m-%d')}"
-
-    def __get_coupling(self, nCr: list[tuple], scoring_method):
-        scoring_fn = {'sorensen': self.__get_sorensen_coef,
-                      'jaccard': self.__get_jaccard_index}
-        if scoring_method not in scoring_fn:
-            raise Exception(
-                f"Scoring method: '{scoring_method}' is not supported")
-
-        return [
-            {
-                'msx': c[0],
-                'msy': c[1],
-                'len_x': len(self.index[c[0]]),
-                'len_y': len(self.index[c[1]]),
-                'len_intersect': len(self.index[c[0]] & self.index[c[1]]),
-                'len_union': len(self.index[c[0]] | self.index[c[1]]),
-                'score': scoring_fn[scoring_method](self.index[c[0]], self.index[c[1]]),
-                'active_period': self.__get_active_period(c[0], c[1])
+    # Returns an index where each row is a group of MS instead of a single MS.
+    # grouping is 'service', 'team' or a mapping of MS (or MS name) to group label; MS without a group are left out.
+    # The group rows are combined from the existing membership matrix, no re-clustering is done.
+    def aggregate(self, grouping) -> 'ClusterIndex':
+        if grouping == 'service':
+            return self
+        if grouping == 'team':
+            if not all(isinstance(ms, MS) for ms in self.mss):
+                raise Exception("Grouping: 'team' needs an index of MS, this index is already aggregated")
+            grouping = {ms: ms.team for ms in self.mss}
+
+        ms_groups = [grouping.get(ms) for ms in self.mss]
+        labels = list(dict.fromkeys(g for g in ms_groups if g is not None))
+        label_codes = {label: code for code, label in enumerate(labels)}
+        ms_codes = [code for code, g in enumerate(ms_groups) if g is not None]
+        group_codes = [label_codes[ms_groups[code]] for code in ms_codes]
+        group_matrix = sparse.csr_matrix((np.ones(len(ms_codes), dtype=np.int64), (group_codes, ms_codes)),
+                                         shape=(len(labels), len(self.mss)))
+
+        membership, churn = _transform_membership(self.__get_membership(), self.churn, lambda m: group_matrix @ m)
+        return self.__from_membership(labels, membership, churn, list(self.clusters), self.cluster_times)
+
+    # Returns an index of only the clusters that start within [start, end] (unix time)
+    def between(self, start: int, end: int) -> 'ClusterIndex':
+        membership = self.__get_membership()
+        cols = np.flatnonzero((self.cluster_times >= start) & (self.cluster_times <= end))
+        membership, churn = _transform_membership(membership, self.churn, lambda m: m[:, cols])
+        rows = np.flatnonzero(np.diff(membership.tocsr().indptr))
+        membership, churn = _transform_membership(membership, churn, lambda m: m.tocsr()[rows])
+        return self.__from_membership([self.mss[r] for r in rows], membership, churn,
+                                      [self.clusters[c] for c in cols], self.cluster_times[cols])
+
+    # Creates an index with the given rows of an existing membership matrix.
+    # clusters must be a new list, clusters added to this index later must not show up in the derived one.
+    def __from_membership(self, labels: list, membership: sparse.csc_matrix, churn: sparse.csc_matrix, clusters,
+                          cluster_times) -> 'ClusterIndex':
+        rows = membership.tocsr()
+
+        derived = ClusterIndex(clusters=clusters, clusters_per_day=self.clusters_per_day)
+        derived.index = {label: set(rows.indices[rows.indptr[code]:rows.indptr[code + 1]].tolist())
+                         for code, label in enumerate(labels)}
+        derived.mss = labels
+        derived.ms_codes = {label: code for code, label in enumerate(labels)}
+        derived.membership = membership
+        derived.churn = churn
+        derived.cluster_times = cluster_times
+        return derived
+
+    # Gets all couplings for each requested aggregation level, e.g. levels=('team', 'service').
+    # Custom levels are named in levels and their mapping of MS to group is given in groupings.
+    def get_all_couplings_by_level(self, levels=('team', 'service'), groupings: dict = None,
+                                   scoring_method='jaccard') -> dict[str, pd.DataFrame]:
+        groupings = groupings if groupings else {}
+        couplings = {}
+        for level in levels:
+            if level in groupings:
+                grouping = groupings[level]
+            elif level in ['service', 'team']:
+                grouping = level
+            else:
+                raise Exception(f"Aggregation level: '{level}' is not supported")
+            couplings[level] = self.aggregate(grouping).get_all_couplings(scoring_method=scoring_method)
+        return couplings
+
+    # Intersection count, first/last co-occurrence time and churn-weighted co-occurrence of the MS pairs that
+    # occur together in at least one cluster, as arrays sorted by pair position (see _triu_pos).
+    # Pairs that never co-occur are not stored, so the size follows the number of co-occurring pairs and not n^2.
+    # Computed once, in a single pass over the cluster memberships.
+    def __get_pair_stats(self):
+        if self.__pair_stats is not None:
+            return self.__pair_stats
+
+        n = len(self.mss)
+        if self.__pair_counts is not None:
+            codes = np.array(list(self.__pair_counts.keys()), dtype=np.int64).reshape(-1, 2)
+            counts = np.array(list(self.__pair_counts.values()), dtype=np.float64).reshape(-1, 5)
+            pos = _triu_pos(codes[:, 0], codes[:, 1], n)
+            order = np.argsort(pos)
+            totals = np.array(self.__churn_totals, dtype=np.float64).reshape(-1, 2)
+            self.__pair_stats = {
+                'pos': pos[order],
+                'codes_x': codes[order, 0],
+                'codes_y': codes[order, 1],
+                'intersect': counts[order, 0].astype(np.int64),
+                'first': counts[order, 1].astype(np.int64),
+                'last': counts[order, 2].astype(np.int64),
+                'churn_min': counts[order, 3],
+                'churn_dot': counts[order, 4],
+                'sizes': np.array([len(self.index[ms]) for ms in self.mss], dtype=np.int64),
+                'churn_totals': totals[:, 0],
+                'churn_sq_totals': totals[:, 1],
+                'n_clusters': len(self.clusters)
             }
-            for c in nCr
-        ]
+            return self.__pair_stats
+
+        membership = self.__get_membership()
+        pairs_i, pairs_j, pairs_c = _cluster_pairs(membership)
+        codes_x, codes_y = membership.indices[pairs_i].astype(np.int64), membership.indices[pairs_j].astype(np.int64)
+        pos = _triu_pos(codes_x, codes_y, n)
+        order = np.argsort(pos, kind='stable')
+        pos, times = pos[order], self.cluster_times[pairs_c[order]]
+        churn_x, churn_y = self.churn.data[pairs_i[order]], self.churn.data[pairs_j[order]]
+        starts = np.flatnonzero(np.r_[True, pos[1:] != pos[:-1]]) if len(pos) else np.empty(0, dtype=np.int64)
+
+        churn = self.churn.tocsr()
+        self.__pair_stats = {
+            'pos': pos[starts],
+            'codes_x': codes_x[order][starts],
+            'codes_y': codes_y[order][starts],
+            'intersect': np.diff(np.r_[starts, len(pos)]).astype(np.int64),
+            'first': np.minimum.reduceat(times, starts),
+            'last': np.maximum.reduceat(times, starts),
+            'churn_min': np.add.reduceat(np.minimum(churn_x, churn_y), starts),
+            'churn_dot': np.add.reduceat(churn_x * churn_y, starts),
+            'sizes': np.diff(churn.indptr).astype(np.int64),
+            'churn_totals': np.asarray(churn.sum(axis=1), dtype=np.float64).ravel(),
+            'churn_sq_totals': np.asarray(churn.multiply(churn).sum(axis=1), dtype=np.float64).ravel(),
+            'n_clusters': membership.shape[1]
+        }
+        return self.__pair_stats
+
+    # Pair statistics of the given pairs of MS codes, with zero counts and NO_COTIME for pairs that never co-occur
+    def __get_pairs(self, codes_x: np.ndarray, codes_y: np.ndarray) -> dict:
+        stats = self.__get_pair_stats()
+        pos = _triu_pos(np.minimum(codes_x, codes_y), np.maximum(codes_x, codes_y), len(self.mss))
+        idx = np.minimum(np.searchsorted(stats['pos'], pos), max(len(stats['pos']) - 1, 0))
+        found = stats['pos'][idx] == pos if len(stats['pos']) else np.zeros(len(pos), dtype=bool)
+
+        def lookup(key, default):
+            values = np.full(len(pos), default, dtype=stats[key].dtype)
+            values[found] = stats[key][idx[found]]
+            return values
+
+        len_x, len_y = stats['sizes'][codes_x], stats['sizes'][codes_y]
+        len_intersect = lookup('intersect', 0)
+        return {
+            'len_x': len_x,
+            'len_y': len_y,
+            'len_intersect': len_intersect,
+            'len_union': len_x + len_y - len_intersect,
+            'n_clusters': stats['n_clusters'],
+            'churn_x': stats['churn_totals'][codes_x],
+            'churn_y': stats['churn_totals'][codes_y],
+            'churn_sq_x': stats['churn_sq_totals'][codes_x],
+            'churn_sq_y': stats['churn_sq_totals'][codes_y],
+            'churn_min': lookup('churn_min', 0.0),
+            'churn_dot': lookup('churn_dot', 0.0),
+            'first': lookup('first', NO_COTIME),
+            'last': lookup('last', NO_COTIME)
+        }
+
+    # Scores of the pairs (from __get_pairs) for one scoring method or a list of them, by method
+    @staticmethod
+    def __get_scores(pairs: dict, scoring_method) -> dict:
+        methods = [scoring_method] if isinstance(scoring_method, str) else list(scoring_method)
+        for method in methods:
+            if method not in SCORING_METHODS:
+                raise Exception(
+                    f"Scoring method: '{method}' is not supported")
+        return {method: SCORING_METHODS[method](pairs) for method in methods}
+
+    # Builds the coupling table for the given pairs of MS codes.
+    # scoring_method is the name of one method in SCORING_METHODS or a list of names, which are all computed
+    # from the same pair statistics. The first one is put in 'score', with a list each one also gets a
+    # 'score_<name>' column.
+    def __get_coupling(self, codes_x: np.ndarray, codes_y: np.ndarray, scoring_method) -> pd.DataFrame:
+        methods = [scoring_method] if isinstance(scoring_method, str) else list(scoring_method)
+        pairs = self.__get_pairs(codes_x, codes_y)
+        scores = self.__get_scores(pairs, methods)
+
+        categories = pd.Index(self.mss, dtype=object)
+        df = pd.DataFrame({
+            'msx': pd.Categorical.from_codes(codes_x, categories=categories),
+            'msy': pd.Categorical.from_codes(codes_y, categories=categories),
+            'len_x': pairs['len_x'],
+            'len_y': pairs['len_y'],
+            'len_intersect': pairs['len_intersect'],
+            'len_union': pairs['len_union'],
+            'score': scores[methods[0]],
+            'first_cotime': pairs['first'],
+            'last_cotime': pairs['last']
+        })
+        if len(methods) > 1:
+            for method in methods:
+                df[f'score_{method}'] = scores[method]
+        return df
 
     # Gets top n most coupled in index
     def get_all_couplings(self, scoring_method='jaccard') -> pd.DataFrame:
-        mss: list[MS] = list(self.index.keys())
-        combs = [(mss[c[0]], mss[c[1]]) for c in combinations([*range(0, len(mss))], 2)]
+        codes_x, codes_y = np.triu_indices(len(self.mss), 1)
 
-        if len(combs) == 0:
-            return pd.DataFrame(columns=['msx', 'msy', 'len_x', 'len_y', 'len_intersect', 'len_union', 'score', 'norm_support', 'active_period'])
+        if len(codes_x) == 0:
+            return pd.DataFrame(columns=['msx', 'msy', 'len_x', 'len_y', 'len_intersect', 'len_union', 'score',
+                                         'first_cotime', 'last_cotime', 'norm_support'])
 
-        df = pd.DataFrame(self.__get_coupling(nCr=combs, scoring_method=scoring_method))
+        df = self.__get_coupling(codes_x, codes_y, scoring_method=scoring_method)
         df['norm_support'] = df['len_intersect'] / np.percentile(df['len_intersect'], 99)
         return df
 
+    # Pairs that co-occur in at least min_support clusters, as arrays of MS codes (index into mss), their
+    # intersection count and score. Only the co-occurring pairs are looked at, unlike get_all_couplings.
+    def get_edges(self, scoring_method='jaccard', min_support=1) -> tuple:
+        stats = self.__get_pair_stats()
+        keep = np.flatnonzero(stats['intersect'] >= max(min_support, 1))
+        codes_x, codes_y = stats['codes_x'][keep], stats['codes_y'][keep]
+        pairs = self.__get_pairs(codes_x, codes_y)
+        return codes_x, codes_y, pairs['len_intersect'], self.__get_scores(pairs, scoring_method)[scoring_method]
+
     # Gets top couplings for a specific MS
     def get_coupling_for(self, msX, scoring_method='jaccard'):
-        nCr = [(msX, msY) for msY in self.index.keys() if msY != msX]
-        return self.__get_coupling(nCr=nCr, scoring_method=scoring_method)
+        code_x = self.ms_codes[msX]
+        codes_y = np.array([code for code in range(len(self.mss)) if code != code_x], dtype=np.int64)
+        codes_x = np.full(len(codes_y), code_x, dtype=np.int64)
+        return self.__get_coupling(codes_x, codes_y, scoring_method=scoring_method).to_dict('records')
+
+
+# Human-readable active period of each pair, only meant for display of a coupling table
+def get_active_period(df: pd.DataFrame) -> pd.Series:
+    local_tz = datetime.now().astimezone().tzinfo
+
+    def fmt(col):
+        times = pd.to_datetime(df[col].where(df[col] != NO_COTIME), unit='s', utc=True).dt.tz_convert(local_tz)
+        return times.dt.strftime('%Y-%m-%d').fillna('TBD')
+
+    return fmt('first_cotime') + ' to ' + fmt('last_cotime')
 
 
 # Gets coupling scores for each pair of microservices over time.
@@ -115,12 +476,29 @@ def get_coupling_data(commits: list[Commit], eps="4h"):
 
     time_start = perf_counter()
 
-    commits_np = np.array(commits).reshape(-1, 1)
-    unix_times = np.array([c.unix_time for c in commits]).reshape(-1, 1)
-    dbscan = DBSCAN(eps=DBSCANClustering.parse_time_str(eps), min_samples=1).fit(X=unix_times)
+    index = create_cluster_index(commits, eps=eps)
+    clusters_per_day = index.get_clusters_per_day()
+
+    time_elapsed = perf_counter() - time_start
+    return index.get_all_couplings(), {'clusters_per_day': clusters_per_day, 'time_elapsed': time_elapsed}
+
+
+# Cluster ID of each commit, a new cluster starts where the gap to the previous commit is larger than eps.
+# Same labels as DBSCAN with min_samples=1 on the commit times, without importing scikit-learn.
+def get_time_clusters(commits: list[Commit], eps="4h") -> np.ndarray:
+    unix_times = np.fromiter((c.unix_time for c in commits), dtype=np.int64, count=len(commits))
+    order = np.argsort(unix_times, kind='stable')
+    starts = np.r_[True, np.diff(unix_times[order]) > DBSCANClustering.parse_time_str(eps)]
+    cluster_ids = np.empty(len(commits), dtype=np.int64)
+    cluster_ids[order] = np.cumsum(starts) - 1
+    return cluster_ids
+
+
+# Clusters the commits in time and creates the index of MS to the clusters they occur in
+def create_cluster_index(commits: list[Commit], eps="4h") -> ClusterIndex:
+    cluster_ids = get_time_clusters(commits, eps=eps)
 
     # Calculate clusters per day
-    cluster_ids = list(cluster_id for cluster_id in dbscan.labels_ if cluster_id != -1)
     df = pd.DataFrame({'commit': commits, 'cluster_id': cluster_ids})
     df['date'] = df['commit'].apply(lambda x: datetime.fromtimestamp(x.unix_time))
     df_days = df.groupby(pd.Grouper(key='date', freq='1D')).agg(unique_clusters=('cluster_id', pd.Series.nunique))
@@ -128,39 +506,56 @@ def get_coupling_data(commits: list[Commit], eps="4h"):
     clusters_per_day = df_days['unique_clusters'].mean()
 
     # Calculate clusters
-    clusters = [list(commits_np[np.where(np.equal(dbscan.labels_, i))][:, 0])
-                for i in set(dbscan.labels_) if i != -1]
+    order = np.argsort(cluster_ids, kind='stable')
+    bounds = np.flatnonzero(np.diff(cluster_ids[order])) + 1
+    clusters = [[commits[i] for i in ids] for ids in np.split(order, bounds)] if len(commits) else []
 
     index = ClusterIndex(clusters=clusters, clusters_per_day=clusters_per_day)
     index.create_index()
+    return index
+
+
+SCORE_BINS = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
+NORM_SUPPORT_BINS = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0, float('inf')]
+RANGE_LABELS = ['0.0-0.2', '0.2-0.4', '0.4-0.6', '0.6-0.8', '0.8-1.0', '> 1.0']
 
-    time_elapsed = perf_counter() - time_start
-    return index.get_all_couplings(), {'clusters_per_day': clusters_per_day, 'time_elapsed': time_elapsed}
 
+# Number of pairs in each (score range, norm support range) cell, ranges are right-inclusive as with pd.cut.
+# Binned with numpy, the provided DataFrame is not modified.
+def get_score_norm_matrix(provided_df) -> pd.DataFrame:
+    score_idx = np.digitize(provided_df['score'].to_numpy(dtype=float), SCORE_BINS, right=True) - 1
+    norm_idx = np.digitize(provided_df['norm_support'].to_numpy(dtype=float), NORM_SUPPORT_BINS, right=True) - 1
+    n_score, n_norm = len(SCORE_BINS) - 1, len(NORM_SUPPORT_BINS) - 1
+    valid = (score_idx >= 0) & (score_idx < n_score) & (norm_idx >= 0) & (norm_idx < n_norm)
 
-def plot_score_norm_matrix(provided_df):
-    score_bins = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
-    norm_support_bins = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0, float('inf')]
-    labels = ['0.0-0.2', '0.2-0.4', '0.4-0.6', '0.6-0.8', '0.8-1.0', '> 1.0']
+    counts = np.bincount(score_idx[valid] * n_norm + norm_idx[valid], minlength=n_score * n_norm)
+    return pd.DataFrame(counts.reshape(n_score, n_norm), index=RANGE_LABELS[:-1], columns=RANGE_LABELS)
 
-    provided_df['score_range'] = pd.cut(provided_df['score'], bins=score_bins, labels=labels[:-1])
-    provided_df['norm_support_range'] = pd.cut(provided_df['norm_support'], bins=norm_support_bins, labels=labels)
 
-    # Create a cross-tabulation
-    cross_tab = pd.crosstab(provided_df['score_range'], provided_df['norm_support_range'], dropna=False)
+# Shows the heatmap, or saves it to output without a display
+def plot_score_norm_matrix(provided_df, output: str = None):
+    import seaborn as sns
 
-    # Reindex the cross-tabulation to include all ranges
-    cross_tab = cross_tab.reindex(index=labels[:-1], columns=labels, fill_value=0)
+    cross_tab = get_score_norm_matrix(provided_df)
 
     # Convert cross-tabulated values to log-scale
     log_scale_cross_tab = np.log1p(cross_tab)  # log1p = log(1 + x), to avoid log(0)
 
     # Plot the heatmap
-    plt.figure(figsize=(7, 5))  # Adjusted figure size to fit the larger heatmap
-    sns.heatmap(log_scale_cross_tab, annot=cross_tab.values, cmap="YlGnBu", fmt='d', annot_kws={"fontsize": 8})
-
-    plt.title('Co-occurrence of Score and Norm Support Ranges')
-    plt.xlabel('Norm Support Range')
-    plt.ylabel('Score Range')
-
-    plt.show()
\ No newline at end of file
+    if output is None:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(7, 5))  # Adjusted figure size to fit the larger heatmap
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(7, 5))
+    ax = fig.subplots()
+    sns.heatmap(log_scale_cross_tab, annot=cross_tab.values, cmap="YlGnBu", fmt='d', annot_kws={"fontsize": 8}, ax=ax)
+
+    ax.set_title('Co-occurrence of Score and Norm Support Ranges')
+    ax.set_xlabel('Norm Support Range')
+    ax.set_ylabel('Score Range')
+
+    if output is None:
+        plt.show()
+    else:
+        fig.savefig(output)
@@ -0,0 +1,57 @@
+import time
+_start_time = time.perf_counter()
+
+import sys
+import argparse
+# Command line entry point for headless coupling runs, e.g. from a cron job:
+#   python CouplingCLI.py --input commits/system.json --eps 4h --scoring jaccard --format csv --output couplings.csv
+# Only the modules needed for the calculation are imported, plotting libraries are never loaded.
+
+# Max time from start of the interpreter until the calculation can begin, enforced by CheckStartup.py.
+# --timing only reports the time from start of this module.
+STARTUP_BUDGET_S = 1.0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Calculates the coupling of each pair of microservices")
+    parser.add_argument("--input", type=str, required=True, help="Path to commit file, e.g. commits/system.json")
+    parser.add_argument("--eps", type=str, default="4h", help="Max time between commits in a cluster")
+    parser.add_argument("--scoring", type=str, default="jaccard",
+                        help="Scoring method, or a comma separated list of them, e.g. jaccard,weighted_jaccard")
+    parser.add_argument("--format", type=str, default="csv", choices=['csv', 'json'], help="Output format")
+    parser.add_argument("--output", type=str, default="-", help="Output file ('-' for stdout)")
+    parser.add_argument("--active-period", action="store_true", help="Add a human-readable active period column")
+    parser.add_argument("--timing", action="store_true",
+                        help=f"Print startup and run time, warn if startup exceeds {STARTUP_BUDGET_S}s")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    from Commit import load_commits
+    from Coupling import create_cluster_index, get_active_period
+    startup_time = time.perf_counter() - _start_time
+
+    index = create_cluster_index(load_commits(args.input), eps=args.eps)
+    df = index.get_all_couplings(scoring_method=args.scoring.split(','))
+    if args.active_period:
+        df['active_period'] = get_active_period(df)
+    df = df.astype({'msx': str, 'msy': str})
+
+    output = sys.stdout if args.output == "-" else args.output
+    if args.format == 'csv':
+        df.to_csv(output, index=False)
+    else:
+        df.to_json(output, orient='records')
+
+    if args.timing:
+        run_time = time.perf_counter() - _start_time - startup_time
+        print(f"Startup time: {startup_time:.3f} seconds (budget {STARTUP_BUDGET_S}s)", file=sys.stderr)
+        print(f"Run time: {run_time:.3f} seconds", file=sys.stderr)
+        if startup_time > STARTUP_BUDGET_S:
+            print("Warning: startup time is over budget", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
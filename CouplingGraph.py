@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from Coupling import ClusterIndex
+# This module contains graph analytics on top of the coupling data of a ClusterIndex.
+# The graph is kept as a symmetric CSR adjacency matrix weighted by score, all algorithms work on its arrays
+# instead of per-node Python objects.
+
+
+class CouplingGraph:
+    # labels: the MS (or group) of each node, adjacency: symmetric n x n matrix of scores,
+    # support: matrix with the same structure holding the number of shared clusters of each edge
+    def __init__(self, labels: list, adjacency: sparse.csr_matrix, support: sparse.csr_matrix):
+        self.labels = labels
+        self.codes = {label: code for code, label in enumerate(labels)}
+        self.adjacency = adjacency
+        self.support = support
+
+    # Builds the graph from the pairs of the index that co-occur in at least min_support clusters
+    # and have a score of at least min_score. Pairs that co-occur but score 0 (e.g. weighted_jaccard without churn)
+    # are left out unless keep_zero_scores is set, they are then stored as explicit zeros and count as edges.
+    @staticmethod
+    def from_index(index: ClusterIndex, scoring_method='jaccard', min_score: float = 0.0,
+                   min_support: int = 1, keep_zero_scores: bool = False) -> 'CouplingGraph':
+        codes_x, codes_y, support, scores = index.get_edges(scoring_method=scoring_method, min_support=min_support)
+        keep = (scores >= min_score) & ((scores > 0) | keep_zero_scores)
+        codes_x, codes_y, support, scores = codes_x[keep], codes_y[keep], support[keep], scores[keep]
+
+        n = len(index.mss)
+        rows, cols = np.r_[codes_x, codes_y], np.r_[codes_y, codes_x]
+        adjacency = sparse.csr_matrix((np.r_[scores, scores], (rows, cols)), shape=(n, n))
+        support = sparse.csr_matrix((np.r_[support, support], (rows, cols)), shape=(n, n))
+        adjacency.sort_indices()
+        support.sort_indices()
+        return CouplingGraph(list(index.mss), adjacency, support)
+
+    def num_nodes(self) -> int:
+        return self.adjacency.shape[0]
+
+    def num_edges(self) -> int:
+        return self.adjacency.nnz // 2
+
+    # Edge list with each edge once (msx before msy in node order)
+    def get_edges(self) -> pd.DataFrame:
+        upper = sparse.triu(self.adjacency, k=1).tocoo()
+        support = sparse.triu(self.support, k=1).tocoo()
+        categories = pd.Index(self.labels, dtype=object)
+        return pd.DataFrame({
+            'msx': pd.Categorical.from_codes(upper.row, categories=categories),
+            'msy': pd.Categorical.from_codes(upper.col, categories=categories),
+            'score': upper.data,
+            'support': support.data
+        })
+
+    # Component id of each node
+    def get_component_ids(self) -> np.ndarray:
+        _, component_ids = csgraph.connected_components(self.adjacency, directed=False)
+        return component_ids
+
+    # Connected components with at least min_size nodes, largest first
+    def get_connected_components(self, min_size: int = 2) -> list[list]:
+        return self.__group_nodes(self.get_component_ids(), min_size)
+
+    # Community id of each node and the modularity of the partition, using the Louvain method:
+    # nodes are moved to the neighbouring community with the largest modularity gain until no move improves it,
+    # then each community is merged into one node and this is repeated on the smaller graph.
+    def get_community_ids(self, resolution: float = 1.0, max_levels: int = 10) -> tuple[np.ndarray, float]:
+        adjacency = self.adjacency.astype(np.float64)
+        node_community = np.arange(self.num_nodes())
+        total_weight = adjacency.sum()
+        if total_weight == 0:
+            return node_community, 0.0
+
+        for _ in range(max_levels):
+            communities = _louvain_local_moves(adjacency, resolution, total_weight)
+            _, communities = np.unique(communities, return_inverse=True)
+            if communities.max() + 1 == adjacency.shape[0]:
+                break
+            node_community = communities[node_community]
+            members = sparse.csr_matrix((np.ones(len(communities)), (np.arange(len(communities)), communities)))
+            adjacency = (members.T @ adjacency @ members).tocsr()
+
+        return node_community, self.get_modularity(node_community, resolution)
+
+    # Communities with at least min_size nodes, largest first
+    def get_communities(self, resolution: float = 1.0, min_size: int = 2) -> list[list]:
+        community_ids, _ = self.get_community_ids(resolution)
+        return self.__group_nodes(community_ids, min_size)
+
+    def get_modularity(self, community_ids: np.ndarray, resolution: float = 1.0) -> float:
+        total_weight = self.adjacency.sum()
+        if total_weight == 0:
+            return 0.0
+        members = sparse.csr_matrix((np.ones(len(community_ids)), (np.arange(len(community_ids)), community_ids)))
+        internal = (members.T @ self.adjacency @ members).diagonal().sum()
+        degree_totals = members.T @ np.asarray(self.adjacency.sum(axis=1)).ravel()
+        return float((internal - resolution * (degree_totals ** 2).sum() / total_weight) / total_weight)
+
+    # Nodes within k hops of ms, with their distance in hops
+    def get_neighborhood(self, ms, k: int = 1) -> dict:
+        distance = np.full(self.num_nodes(), -1)
+        frontier = np.array([self.codes[ms]])
+        distance[frontier] = 0
+        for hop in range(1, k + 1):
+            neighbours = np.unique(self.adjacency[frontier].indices)
+            frontier = neighbours[distance[neighbours] < 0]
+            if len(frontier) == 0:
+                break
+            distance[frontier] = hop
+        reached = np.flatnonzero(distance > 0)
+        return {self.labels[code]: int(distance[code]) for code in reached[np.argsort(distance[reached], kind='stable')]}
+
+    # Degree, weighted degree (sum of scores) and PageRank of every node
+    def get_centrality(self, damping: float = 0.85, max_iter: int = 100, tol: float = 1e-10) -> pd.DataFrame:
+        n = self.num_nodes()
+        degree = np.diff(self.adjacency.indptr)
+        strength = np.asarray(self.adjacency.sum(axis=1)).ravel()
+
+        # Power iteration on the score-weighted transition matrix, nodes without edges spread evenly
+        inv_strength = np.divide(1.0, strength, out=np.zeros(n), where=strength > 0)
+        transition = sparse.diags(inv_strength) @ self.adjacency
+        rank = np.full(n, 1.0 / n) if n else np.zeros(0)
+        for _ in range(max_iter if n else 0):
+            dangling = rank[strength == 0].sum()
+            new_rank = damping * (transition.T @ rank + dangling / n) + (1 - damping) / n
+            converged = np.abs(new_rank - rank).sum() < tol
+            rank = new_rank
+            if converged:
+                break
+
+        return pd.DataFrame({
+            'ms': pd.Categorical.from_codes(np.arange(n), categories=pd.Index(self.labels, dtype=object)),
+            'degree': degree,
+            'strength': strength,
+            'pagerank': rank
+        })
+
+    def __group_nodes(self, group_ids: np.ndarray, min_size: int) -> list[list]:
+        order = np.argsort(group_ids, kind='stable')
+        groups = np.split(order, np.flatnonzero(np.diff(group_ids[order])) + 1) if len(order) else []
+        groups = sorted((g for g in groups if len(g) >= min_size), key=len, reverse=True)
+        return [[self.labels[code] for code in group] for group in groups]
+
+
+# One level of Louvain local moves, returns the community of each node.
+# All nodes pick their best neighbouring community at the same time from the sparse node x community link
+# matrix, so each pass is a few operations on the edge arrays instead of a Python loop over the nodes.
+# Passes alternate between only moving nodes to communities with a lower id and only to a higher id, so that
+# nodes do not keep swapping places. A batch of moves that does not increase modularity is retried with only the
+# movers that have no moving neighbour with a larger gain, and then with the half of those with the largest gains.
+# The level ends when a pass in each direction increases modularity by less than threshold.
+def _louvain_local_moves(adjacency: sparse.csr_matrix, resolution: float, total_weight: float,
+                         max_passes: int = 30, threshold: float = 1e-6) -> np.ndarray:
+    n = adjacency.shape[0]
+    edges = adjacency.tocoo()
+    not_self = edges.row != edges.col
+    rows, cols, weights = edges.row[not_self], edges.col[not_self], edges.data[not_self]
+    self_weights = edges.data[~not_self]
+    row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    row_ids = rows[row_starts]
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    communities = np.arange(n)
+    modularity = _get_modularity(communities, rows, cols, weights, self_weights, degree, resolution,
+                                 total_weight)
+
+    off_diagonal = sparse.csr_matrix((weights, (rows, cols)), shape=(n, n))
+
+    previous_gain = np.inf
+    for current_pass in range(max_passes):
+        totals = np.bincount(communities, weights=degree, minlength=n)
+
+        # Weight of the links of each node to each neighbouring community
+        members = sparse.csr_matrix((np.ones(n), (np.arange(n), communities)), shape=(n, n))
+        links = (off_diagonal @ members).tocsr()
+        has_links = np.flatnonzero(np.diff(links.indptr))
+        if len(has_links) == 0:
+            break
+        nodes = np.repeat(np.arange(n), np.diff(links.indptr))
+        own = links.indices == communities[nodes]
+        gains = links.data - resolution * (totals[links.indices] - own * degree[nodes]) * degree[nodes] / total_weight
+
+        # Gain of staying, also for nodes without links into their own community
+        stay = -resolution * (totals[communities] - degree) * degree / total_weight
+        stay[nodes[own]] += links.data[own]
+
+        # Best target of each node, the lowest community id on ties. Only moves in the direction of this pass are
+        # made, the other nodes wait for the next pass.
+        best_gains = np.maximum.reduceat(gains, links.indptr[has_links])
+        is_best = gains >= np.repeat(best_gains, np.diff(links.indptr)[has_links])
+        movers = has_links
+        targets = np.minimum.reduceat(np.where(is_best, links.indices, n), links.indptr[has_links])
+        improvement = best_gains - stay[movers]
+
+        current = communities[movers]
+        move = (targets != current) & (improvement > 1e-12)
+        move &= (targets < current) if current_pass % 2 == 0 else (targets > current)
+        movers, targets, improvement = movers[move], targets[move], improvement[move]
+
+        gain = 0.0
+        independent = False
+        while len(movers) > 0:
+            candidate = communities.copy()
+            candidate[movers] = targets
+            candidate_modularity = _get_modularity(candidate, rows, cols, weights, self_weights, degree,
+                                                   resolution, total_weight)
+            if candidate_modularity > modularity + 1e-12:
+                gain = candidate_modularity - modularity
+                communities, modularity = candidate, candidate_modularity
+                break
+            if not independent:
+                # Only the movers without a neighbouring mover that has a larger gain
+                rank = np.zeros(n, dtype=np.int64)
+                rank[movers[np.argsort(improvement, kind='stable')]] = np.arange(1, len(movers) + 1)
+                neighbour_rank = np.zeros(n, dtype=np.int64)
+                neighbour_rank[row_ids] = np.maximum.reduceat(rank[cols], row_starts)
+                keep = np.flatnonzero(rank[movers] > neighbour_rank[movers])
+                independent = True
+            else:
+                keep = np.argsort(-improvement, kind='stable')[:len(movers) // 2]
+            movers, targets, improvement = movers[keep], targets[keep], improvement[keep]
+        if gain < threshold and previous_gain < threshold:
+            break
+        previous_gain = gain
+    return communities
+
+
+# Modularity of a partition from the edge arrays of _louvain_local_moves, same definition as get_modularity
+def _get_modularity(communities, rows, cols, weights, self_weights, degree, resolution,
+                    total_weight) -> float:
+    internal = weights[communities[rows] == communities[cols]].sum() + self_weights.sum()
+    totals = np.bincount(communities, weights=degree, minlength=len(degree))
+    return float((internal - resolution * (totals ** 2).sum() / total_weight) / total_weight)
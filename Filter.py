@@ -1,43 +1,8 @@
-import json
 import subprocess
 import os
-import glob
 import time
 
-
-def get_nodes(data):
-    repo_nodes = data['data']['organization']['team']['repositories']['nodes']
-    nodes = []
-    excluded = []
-    for node in repo_nodes:
-        if node['defaultBranchRef'] is None:
-            print(f'Warning: {node["name"]} has no default branch, skipping')
-            excluded.append('{:<100s}{}'.format(node['name'], 'has no default branch'))
-            continue
-        nodes.append({
-            "commitCount": node['defaultBranchRef']['target']['history']['totalCount'],
-            "name": node["name"],
-            "languages": [n2['name'] for n2 in node["languages"]['nodes']],
-            "files": [n['name'] for n in node['object']['entries']]
-        })
-    return nodes, excluded
-
-
-# True if pass
-def apply_filter(n) -> bool:
-    if "ci-cd.yml" not in n['files']:
-        return False
-    return True
-
-
-def apply_filter2(n) -> bool:
-    if "pom.xml" not in n['files']:
-        return False
-    return True
-
-
-def apply_filter3(n) -> bool:
-    return n["commitCount"] > 50
+from MetaDataStore import open_store, FILTER_RULES
 
 
 def clone_repos(to_clone, where):
@@ -76,31 +41,14 @@ def main(argv):
     input_dir = argv[0]
     output_dir = argv[1]
 
-    json_files = glob.glob(os.path.join(input_dir, '*.json'))
-    all_nodes = []
-    excluded = []
-    included = []
-
-    for file in json_files:
-        f = open(file)
-        data = json.load(f)
-        inc, ex = get_nodes(data)
-        all_nodes += inc
-        excluded += ex
-        f.close()
-
-    for n in all_nodes:
-        exclude_reasons = []
-        if apply_filter(n) is False:
-            exclude_reasons.append('ci-cd.yml missing')
-        if apply_filter2(n) is False:
-            exclude_reasons.append('pom.xml missing')
-        if apply_filter3(n) is False:
-            exclude_reasons.append('< 50 commits')
-        if len(exclude_reasons) > 0:
-            excluded.append('{:<100s}{}'.format(n['name'], '; '.join(exclude_reasons)))
-        else:
-            included.append(n['name'])
+    with open_store(input_dir) as store:
+        excluded = ['{:<100s}{}'.format(name, reason) for name, reason in store.get_skipped()]
+        included = []
+        for name, exclude_reasons in store.evaluate(FILTER_RULES):
+            if len(exclude_reasons) > 0:
+                excluded.append('{:<100s}{}'.format(name, '; '.join(exclude_reasons)))
+            else:
+                included.append(name)
 
     removed_repos = clone_repos(included, output_dir)
     for repo_name in removed_repos:
@@ -115,4 +63,4 @@ def main(argv):
     # Write included repos to file
     with open(os.path.join(input_dir, 'excluded.txt'), 'w') as fp:
         for item in excluded:
-            fp.write("%s\n" % item)
\ No newline at end of file
+            fp.write("%s\n" % item)
@@ -0,0 +1,164 @@
+import os
+import glob
+import json
+import sqlite3
+import hashlib
+# This module contains a local SQLite store of the repository metadata fetched by FetchMetaData.
+# The page*.json files are ingested incrementally (only files whose mtime and hash changed are parsed again)
+# and the filter rules run as queries on the indexed repo attributes.
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, hash TEXT);
+    CREATE TABLE IF NOT EXISTS repos (id INTEGER PRIMARY KEY, file TEXT, position INTEGER, name TEXT,
+                                      commit_count INTEGER);
+    CREATE TABLE IF NOT EXISTS repo_files (repo_id INTEGER, name TEXT);
+    CREATE TABLE IF NOT EXISTS repo_languages (repo_id INTEGER, name TEXT);
+    CREATE TABLE IF NOT EXISTS skipped (file TEXT, name TEXT, reason TEXT);
+    CREATE TABLE IF NOT EXISTS forks (name TEXT, parent TEXT);
+    CREATE INDEX IF NOT EXISTS repos_file ON repos (file);
+    CREATE INDEX IF NOT EXISTS repo_files_name ON repo_files (name, repo_id);
+    CREATE INDEX IF NOT EXISTS repo_files_repo ON repo_files (repo_id);
+    CREATE INDEX IF NOT EXISTS repo_languages_repo ON repo_languages (repo_id);
+    CREATE INDEX IF NOT EXISTS forks_name ON forks (name);
+"""
+
+# A filter rule is (reason for exclusion, SQL condition on repo r that must hold to pass, query parameters)
+HAS_FILE = "EXISTS (SELECT 1 FROM repo_files f WHERE f.repo_id = r.id AND f.name = ?)"
+HAS_LANGUAGE = "EXISTS (SELECT 1 FROM repo_languages l WHERE l.repo_id = r.id AND l.name = ?)"
+
+CI_CD_RULE = ('ci-cd.yml missing', HAS_FILE, ('ci-cd.yml',))
+POM_RULE = ('pom.xml missing', HAS_FILE, ('pom.xml',))
+COMMIT_COUNT_RULE = ('< 50 commits', "r.commit_count > ?", (50,))
+FORK_RULE = ('is a fork', "NOT EXISTS (SELECT 1 FROM forks k WHERE k.name = r.name)", ())
+
+FILTER_RULES = [CI_CD_RULE, POM_RULE, COMMIT_COUNT_RULE]
+
+
+def get_nodes(data):
+    repo_nodes = data['data']['organization']['team']['repositories']['nodes']
+    nodes = []
+    excluded = []
+    for node in repo_nodes:
+        if node['defaultBranchRef'] is None:
+            print(f'Warning: {node["name"]} has no default branch, skipping')
+            excluded.append({"name": node["name"], "reason": 'has no default branch'})
+            continue
+        nodes.append({
+            "commitCount": node['defaultBranchRef']['target']['history']['totalCount'],
+            "name": node["name"],
+            "languages": [n2['name'] for n2 in node["languages"]['nodes']] if node.get("languages") else [],
+            "files": [n['name'] for n in node['object']['entries']]
+        })
+    return nodes, excluded
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class MetaDataStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Ingests the page*.json files and forks.txt of a metadata folder, skipping files that did not change.
+    # Files are stored by name, the store is meant to be kept in the folder itself.
+    # Returns the number of files that were parsed.
+    def ingest(self, dir: str) -> int:
+        names = sorted(os.path.basename(path) for path in glob.glob(os.path.join(dir, 'page*.json')))
+        if os.path.exists(os.path.join(dir, 'forks.txt')):
+            names.append('forks.txt')
+
+        parsed = 0
+        with self.conn:
+            known = {name: (mtime, hash)
+                     for name, mtime, hash in self.conn.execute("SELECT path, mtime, hash FROM files")}
+            for name in set(known) - set(names):
+                self.__delete_file(name)
+                self.conn.execute("DELETE FROM files WHERE path = ?", (name,))
+
+            for name in names:
+                path = os.path.join(dir, name)
+                mtime = os.stat(path).st_mtime_ns
+                if name in known and known[name][0] == mtime:
+                    continue
+                hash = file_hash(path)
+                if name not in known or known[name][1] != hash:
+                    self.__delete_file(name)
+                    if name == 'forks.txt':
+                        self.__insert_forks(path)
+                    else:
+                        self.__insert_page(path, name)
+                    parsed += 1
+                self.conn.execute("INSERT OR REPLACE INTO files (path, mtime, hash) VALUES (?, ?, ?)",
+                                  (name, mtime, hash))
+        return parsed
+
+    def __delete_file(self, name: str):
+        repo_ids = "SELECT id FROM repos WHERE file = ?"
+        self.conn.execute(f"DELETE FROM repo_files WHERE repo_id IN ({repo_ids})", (name,))
+        self.conn.execute(f"DELETE FROM repo_languages WHERE repo_id IN ({repo_ids})", (name,))
+        self.conn.execute("DELETE FROM repos WHERE file = ?", (name,))
+        self.conn.execute("DELETE FROM skipped WHERE file = ?", (name,))
+        if name == 'forks.txt':
+            self.conn.execute("DELETE FROM forks")
+
+    def __insert_page(self, path: str, name: str):
+        with open(path) as f:
+            nodes, excluded = get_nodes(json.load(f))
+
+        for position, node in enumerate(nodes):
+            repo_id = self.conn.execute(
+                "INSERT INTO repos (file, position, name, commit_count) VALUES (?, ?, ?, ?)",
+                (name, position, node['name'], node['commitCount'])).lastrowid
+            self.conn.executemany("INSERT INTO repo_files (repo_id, name) VALUES (?, ?)",
+                                  [(repo_id, file_name) for file_name in node['files']])
+            self.conn.executemany("INSERT INTO repo_languages (repo_id, name) VALUES (?, ?)",
+                                  [(repo_id, language) for language in node['languages']])
+        self.conn.executemany("INSERT INTO skipped (file, name, reason) VALUES (?, ?, ?)",
+                              [(name, ex['name'], ex['reason']) for ex in excluded])
+
+    def __insert_forks(self, path: str):
+        with open(path) as f:
+            forks = [line.strip().split(' is a fork of ') for line in f if line.strip()]
+        self.conn.executemany("INSERT INTO forks (name, parent) VALUES (?, ?)",
+                              [(fork[0], fork[1] if len(fork) > 1 else None) for fork in forks])
+
+    # Repos that were skipped while ingesting, as (name, reason)
+    def get_skipped(self) -> list[tuple[str, str]]:
+        return self.conn.execute("SELECT name, reason FROM skipped ORDER BY file, rowid").fetchall()
+
+    # Evaluates the rules on every repo, returns (name, reasons for exclusion) in ingest order
+    def evaluate(self, rules=FILTER_RULES) -> list[tuple[str, list[str]]]:
+        columns = ''.join(f", NOT ({condition})" for _, condition, _ in rules)
+        params = [param for _, _, rule_params in rules for param in rule_params]
+        rows = self.conn.execute(f"SELECT r.name{columns} FROM repos r ORDER BY r.file, r.position", params)
+        return [(row[0], [rules[i][0] for i, failed in enumerate(row[1:]) if failed]) for row in rows]
+
+    # Number of repos, commits and top-level files of the repos passing all rules (all repos if rules is empty)
+    def get_stats(self, rules=()) -> dict[str, int]:
+        where = ' AND '.join(f"({condition})" for _, condition, _ in rules) if rules else '1'
+        params = [param for _, _, rule_params in rules for param in rule_params]
+        repos, commits, files = self.conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(r.commit_count), 0), "
+            f"COALESCE(SUM((SELECT COUNT(*) FROM repo_files f WHERE f.repo_id = r.id)), 0) "
+            f"FROM repos r WHERE {where}", params).fetchone()
+        return {'repos': repos, 'commits': commits, 'files': files}
+
+
+# Opens the store of a metadata folder and brings it up to date with the files in it
+def open_store(dir: str, db_name: str = 'metadata.db') -> MetaDataStore:
+    store = MetaDataStore(os.path.join(dir, db_name))
+    store.ingest(dir)
+    return store
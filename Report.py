@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import argparse
+import concurrent.futures
+
+from Commit import load_commits
+from Coupling import create_cluster_index, plot_score_norm_matrix
+from ClusteringMethod import KDEClustering
+# This module renders the report figures of many systems to image files, without a display.
+# Each system is rendered in its own worker process.
+
+
+# Renders the figures of one system (a commit file) and returns the paths of the written files
+def render_system_report(file_path: str, output: str, eps="4h", bandwidth: float = 3600.0) -> list[str]:
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    commits = load_commits(file_path)
+
+    matrix_path = os.path.join(output, f'{name}_score_norm_matrix.png')
+    df = create_cluster_index(commits, eps=eps).get_all_couplings()
+    plot_score_norm_matrix(df, output=matrix_path)
+
+    density_path = os.path.join(output, f'{name}_density.png')
+    kde = KDEClustering(bandwidth=bandwidth)
+    kde.run(commits)
+    kde.plot_density(output=density_path)
+
+    return [matrix_path, density_path]
+
+
+# Renders the reports of all systems, one worker process each. A system that fails does not stop the others,
+# the failed systems and their errors are printed at the end and returned with the written files.
+def render_reports(file_paths: list[str], output: str, eps="4h", bandwidth: float = 3600.0,
+                   workers: int = None) -> tuple[list[str], dict[str, str]]:
+    start_time = time.monotonic()
+
+    if not os.path.exists(output):
+        os.makedirs(output)
+
+    written = {}
+    failed = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render_system_report, file_path, output, eps, bandwidth): file_path
+                   for file_path in file_paths}
+        for future in concurrent.futures.as_completed(futures):
+            file_path = futures[future]
+            try:
+                written[file_path] = future.result()
+            except Exception as e:
+                failed[file_path] = f"{type(e).__name__}: {e}"
+
+    elapsed_time = time.monotonic() - start_time
+    print(f"Rendered {len(written)} of {len(file_paths)} reports in {elapsed_time:.2f} seconds")
+    for file_path, error in failed.items():
+        print(f"Failed: {file_path}: {error}")
+    return [path for file_path in file_paths if file_path in written for path in written[file_path]], failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, nargs='+', required=True, help="Commit files, e.g. commits/*.json")
+    parser.add_argument("--output", type=str, required=True, help="Folder to write the figures to")
+    parser.add_argument("--eps", type=str, default="4h", help="Max time between commits in a cluster")
+    parser.add_argument("--bandwidth", type=float, default=3600.0, help="Bandwidth of the density estimate")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+    _, failed = render_reports(args.input, args.output, eps=args.eps, bandwidth=args.bandwidth, workers=args.workers)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
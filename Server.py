@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import threading
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from Commit import load_commits
+from Coupling import ClusterIndex, create_cluster_index, SCORING_METHODS
+# This module contains a long-lived query service for coupling data.
+# The commit store is loaded once and the cluster index is kept in memory, so queries do not rebuild it.
+# Endpoints (GET, JSON responses):
+#   /coupling?ms=<name>[&scoring=jaccard]       couplings of one MS
+#   /top?k=10[&scoring=jaccard]                 the k highest scoring pairs
+#   /range?start=<date>&end=<date>[&k=10]       top pairs using only clusters that start within the range, both ends
+#                                               inclusive. Dates are YYYY-MM-DD in local time (a date-only end covers
+#                                               the whole day) or unix time in seconds (used as is).
+#   /metrics                                    request latency per endpoint
+# Invalid or missing parameters get a 400 response, any other failure a 500.
+
+
+class CouplingStore:
+    def __init__(self, file_path: str, eps="4h"):
+        self.file_path = file_path
+        self.eps = eps
+        self.index: ClusterIndex = None
+        self.couplings: dict[str, pd.DataFrame] = {}
+        self.mtime = None
+        self.loaded_at = None
+        self.__reload_lock = threading.Lock()
+
+    # Builds the new index off to the side and swaps it in, so queries in flight keep using the old one
+    def load(self):
+        with self.__reload_lock:
+            mtime = os.path.getmtime(self.file_path)
+            index = create_cluster_index(load_commits(self.file_path), eps=self.eps)
+            # Computes the pair counters up front, after this the index is only read
+            couplings = {'jaccard': index.get_all_couplings(scoring_method='jaccard')}
+            self.index, self.couplings, self.mtime, self.loaded_at = index, couplings, mtime, time.time()
+
+    def reload_if_changed(self) -> bool:
+        if os.path.getmtime(self.file_path) == self.mtime:
+            return False
+        self.load()
+        return True
+
+    # Reloads the store in a background thread whenever the file changes on disk
+    def watch(self, interval: float = 5.0):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.reload_if_changed():
+                        print(f"Reloaded {self.file_path}")
+                except Exception as e:
+                    print(f"Reload failed: {str(e)}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def get_all_couplings(self, scoring_method='jaccard') -> pd.DataFrame:
+        couplings = self.couplings
+        if scoring_method not in couplings:
+            couplings[scoring_method] = self.index.get_all_couplings(scoring_method=scoring_method)
+        return couplings[scoring_method]
+
+
+class LatencyMetrics:
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self.samples: dict[str, list[float]] = {}
+        self.counts: dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float):
+        with self.__lock:
+            samples = self.samples.setdefault(endpoint, [])
+            samples.append(seconds)
+            if len(samples) > self.max_samples:
+                del samples[:len(samples) - self.max_samples]
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def summary(self) -> dict:
+        with self.__lock:
+            samples = {endpoint: np.array(s) * 1000 for endpoint, s in self.samples.items()}
+            counts = dict(self.counts)
+        return {
+            endpoint: {
+                'count': counts[endpoint],
+                'mean_ms': float(s.mean()),
+                'p50_ms': float(np.percentile(s, 50)),
+                'p95_ms': float(np.percentile(s, 95)),
+                'p99_ms': float(np.percentile(s, 99)),
+                'max_ms': float(s.max())
+            }
+            for endpoint, s in samples.items()
+        }
+
+
+# Invalid or missing query parameter, answered with a 400. Any other exception is a server fault.
+class BadRequest(Exception):
+    pass
+
+
+# Unix time of a YYYY-MM-DD date (local midnight) or of a unix time in seconds.
+# With end_of_day, a date is the last second of that day, so it can be used as an inclusive end.
+def parse_time(value: str, end_of_day: bool = False) -> int:
+    if value.isdigit():
+        return int(value)
+    try:
+        date = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise BadRequest(f"Invalid time: '{value}', expected YYYY-MM-DD or unix time")
+    if end_of_day:
+        return int((date + timedelta(days=1)).timestamp()) - 1
+    return int(date.timestamp())
+
+
+def get_param(params: dict, name: str) -> str:
+    if name not in params:
+        raise BadRequest(f"Missing parameter: '{name}'")
+    return params[name]
+
+
+def get_int_param(params: dict, name: str, default: int) -> int:
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise BadRequest(f"Invalid value of '{name}': '{params[name]}', expected an integer")
+
+
+def get_scoring(params: dict) -> str:
+    scoring_method = params.get('scoring', 'jaccard')
+    if scoring_method not in SCORING_METHODS:
+        raise BadRequest(f"Scoring method: '{scoring_method}' is not supported")
+    return scoring_method
+
+
+def to_records(df: pd.DataFrame) -> list[dict]:
+    df = df.astype({'msx': str, 'msy': str})
+    return json.loads(df.to_json(orient='records'))
+
+
+def top_k(df: pd.DataFrame, k: int) -> pd.DataFrame:
+    if df.empty:
+        return df
+    return df.nlargest(k, 'score')
+
+
+def create_handler(store: CouplingStore, metrics: LatencyMetrics):
+    class CouplingRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            routes = {'/coupling': self.coupling, '/top': self.top, '/range': self.range, '/metrics': self.metrics}
+
+            if url.path not in routes:
+                self.respond(404, {'error': f"Unknown endpoint: '{url.path}'"})
+                return
+            try:
+                self.respond(200, routes[url.path](params))
+            except BadRequest as e:
+                self.respond(400, {'error': str(e)})
+            except Exception as e:
+                self.respond(500, {'error': f"{type(e).__name__}: {str(e)}"})
+            metrics.record(url.path, time.perf_counter() - start)
+
+        def coupling(self, params):
+            index, ms = store.index, get_param(params, 'ms')
+            if ms not in index.ms_codes:
+                raise BadRequest(f"Unknown MS: '{ms}'")
+            scoring_method, k = get_scoring(params), get_int_param(params, 'k', len(index.mss))
+            couplings = index.get_coupling_for(ms, scoring_method=scoring_method)
+            if not couplings:
+                return []
+            return to_records(top_k(pd.DataFrame(couplings), k))
+
+        def top(self, params):
+            scoring_method, k = get_scoring(params), get_int_param(params, 'k', 10)
+            return to_records(top_k(store.get_all_couplings(scoring_method=scoring_method), k))
+
+        def range(self, params):
+            start = parse_time(get_param(params, 'start'))
+            end = parse_time(get_param(params, 'end'), end_of_day=True)
+            scoring_method, k = get_scoring(params), get_int_param(params, 'k', 10)
+            df = store.index.between(start, end).get_all_couplings(scoring_method=scoring_method)
+            return to_records(top_k(df, k))
+
+        def metrics(self, params):
+            return {'loaded_at': store.loaded_at, 'latency': metrics.summary()}
+
+        def respond(self, status: int, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return CouplingRequestHandler
+
+
+def serve(file_path: str, host: str = 'localhost', port: int = 8080, eps="4h", reload_interval: float = 5.0):
+    store = CouplingStore(file_path, eps=eps)
+    store.load()
+    store.watch(reload_interval)
+
+    server = ThreadingHTTPServer((host, port), create_handler(store, LatencyMetrics()))
+    print(f"Serving coupling data of {file_path} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, required=True, help="Path to commit file, e.g. commits/system.json")
+    parser.add_argument("--host", type=str, default="localhost", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--eps", type=str, default="4h", help="Max time between commits in a cluster")
+    parser.add_argument("--reload-interval", type=float, default=5.0, help="Seconds between checks for a changed input file")
+    args = parser.parse_args()
+    serve(args.input, host=args.host, port=args.port, eps=args.eps, reload_interval=args.reload_interval)
+
+
+if __name__ == '__main__':
+    main()
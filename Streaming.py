@@ -0,0 +1,129 @@
+import os
+import heapq
+from collections import deque
+import json
+import sys
+import argparse
+import pandas as pd
+
+from Commit import Commit, load_commits, commit_from_dict
+from ClusteringMethod import DBSCANClustering
+from Coupling import ClusterIndex
+# This module contains the online mode of the coupling calculation.
+# Commits are fed one at a time in (roughly) time order, e.g. from a post-receive hook writing to a pipe,
+# and the temporal clusters are folded into a live ClusterIndex as soon as they are closed.
+
+
+class StreamingCoupling:
+    # eps: max gap between two commits of the same cluster, same format as DBSCANClustering
+    # lateness: how far behind the newest commit seen a commit may arrive and still be placed in order
+    # max_late_kept: how many of the most recent late commits are kept for diagnostics, all of them are counted
+    def __init__(self, eps="4h", lateness="0s", on_close=None, max_late_kept=100):
+        self.eps = DBSCANClustering.parse_time_str(eps)
+        self.lateness = DBSCANClustering.parse_time_str(lateness)
+        self.on_close = on_close
+        self.index = ClusterIndex(clusters=[])
+        self.current: list[Commit] = []
+        self.late_count = 0
+        self.late_commits: deque[Commit] = deque(maxlen=max_late_kept)
+        self.watermark = None
+        self.__pending = []
+        self.__seq = 0
+
+    # Commits older than this can no longer be placed in order
+    def get_frontier(self):
+        if self.watermark is None:
+            return None
+        return self.watermark - self.lateness
+
+    def add(self, commit: Commit):
+        frontier = self.get_frontier()
+        if frontier is not None and commit.unix_time < frontier:
+            self.late_count += 1
+            self.late_commits.append(commit)
+            return
+
+        heapq.heappush(self.__pending, (commit.unix_time, self.__seq, commit))
+        self.__seq += 1
+        self.watermark = commit.unix_time if self.watermark is None else max(self.watermark, commit.unix_time)
+        self.__release(self.get_frontier())
+
+    # Releases all buffered commits and closes the current cluster, e.g. at the end of a replay
+    def flush(self):
+        while self.__pending:
+            self.__extend(heapq.heappop(self.__pending)[2])
+        self.__close()
+
+    # Coupling of all closed clusters, the currently open cluster is not included
+    def snapshot(self, scoring_method='jaccard') -> pd.DataFrame:
+        return self.index.get_all_couplings(scoring_method=scoring_method)
+
+    def get_coupling_for(self, msX, scoring_method='jaccard'):
+        return self.index.get_coupling_for(msX, scoring_method=scoring_method)
+
+    def __release(self, frontier):
+        while self.__pending and self.__pending[0][0] <= frontier:
+            self.__extend(heapq.heappop(self.__pending)[2])
+        # No commit at or after the frontier can extend the current cluster anymore
+        if self.current and frontier - self.current[-1].unix_time > self.eps:
+            self.__close()
+
+    def __extend(self, commit: Commit):
+        if self.current and commit.unix_time - self.current[-1].unix_time > self.eps:
+            self.__close()
+        self.current.append(commit)
+
+    def __close(self):
+        if not self.current:
+            return
+        cluster, self.current = self.current, []
+        self.index.add_cluster(cluster)
+        if self.on_close:
+            self.on_close(self)
+
+
+# Replays a recorded commit file through the online mode
+def replay(file_path: str, eps="4h", lateness="0s") -> StreamingCoupling:
+    stream = StreamingCoupling(eps=eps, lateness=lateness)
+    for commit in load_commits(file_path):
+        stream.add(commit)
+    stream.flush()
+    return stream
+
+
+# Reads one JSON encoded commit per line (CommitEncoder format) until the feed is closed
+def follow(feed, stream: StreamingCoupling) -> StreamingCoupling:
+    for line in feed:
+        if line.strip():
+            stream.add(commit_from_dict(json.loads(line)))
+    stream.flush()
+    return stream
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default="-", help="Commit feed, one JSON commit per line ('-' for stdin)")
+    parser.add_argument("--output", type=str, required=True, help="CSV file rewritten with a snapshot on every closed cluster")
+    parser.add_argument("--eps", type=str, default="4h", help="Max time between commits in a cluster")
+    parser.add_argument("--lateness", type=str, default="0s", help="How late a commit may arrive and still be used")
+    args = parser.parse_args()
+
+    # Written next to the output and moved onto it, so a reader never sees a partly written snapshot
+    def write_snapshot(stream: StreamingCoupling):
+        tmp_path = os.path.join(os.path.dirname(os.path.abspath(args.output)),
+                                f".{os.path.basename(args.output)}.tmp")
+        stream.snapshot().to_csv(tmp_path, index=False)
+        os.replace(tmp_path, args.output)
+
+    stream = StreamingCoupling(eps=args.eps, lateness=args.lateness, on_close=write_snapshot)
+    if args.input == "-":
+        follow(sys.stdin, stream)
+    else:
+        with open(args.input, 'r') as feed:
+            follow(feed, stream)
+    if stream.late_count:
+        print(f"{stream.late_count} commits arrived too late and were skipped")
+
+
+if __name__ == '__main__':
+    main()